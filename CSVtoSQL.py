@@ -1,10 +1,37 @@
 import argparse
 import configparser
+import csv
+import tempfile
+from itertools import islice
 import pandas as pd
-import numpy as np
 import mysql.connector
 from mysql.connector import Error
 
+# CSV列类型（与建表结构对应），整数列使用可空Int64避免缺失值上转为float
+BASIC_DTYPES = {
+    'fasta_file_name': str,
+    'fasta_file_md5': str,
+    'total_size_bp': 'Int64',
+    'sequences': 'Int64',
+    'largest_seq_bp': 'Int64',
+    'smallest_seq_bp': 'Int64',
+    'n50_bp': 'Int64',
+    'l50': 'Int64',
+    'classification': str
+}
+SUPPLY_DTYPES = {
+    'fasta_file_name': str,
+    'fasta_file_md5': str,
+    'completeness(%)': 'float64',
+    'contamination(%)': 'float64',
+    'QS': 'float64',
+    'quality_class': str
+}
+
+# 服务器或客户端禁用LOCAL INFILE时的错误码
+# （1148: ER_NOT_ALLOWED_COMMAND, 2068: CR_LOAD_DATA_LOCAL_INFILE_REJECTED, 3948: ER_CLIENT_LOCAL_FILES_DISABLED）
+LOCAL_INFILE_DISABLED_ERRNOS = {1148, 2068, 3948}
+
 def sanitize_column_names(df):
     df.columns = [col.replace('(%)', '').replace('%', '_percent')
                  .replace(' ', '_').replace('-', '_')
@@ -52,27 +79,61 @@ def create_tables(cursor, basic_table, supply_table, uk_column):
     cursor.execute(supply_table_sql)
     print(f"Tables created: {basic_table}, {supply_table}")
 
-def import_df_to_mysql(cursor, table_name, df, batch_size=500):
-    """核心修正：处理数据类型转换"""
-    df = sanitize_column_names(df)
-    # 关键修复：转换numpy类型为Python原生类型
-    df = df.replace({np.nan: None})
-    df = df.astype(object)
+def escape_load_data_fields(df):
+    """按LOAD DATA的转义规则（ESCAPED BY '\\'）转义字符串列中的特殊字符"""
+    df = df.copy()
+    for col in df.select_dtypes(include='object').columns:
+        # 反斜杠须最先替换，避免重复转义
+        df[col] = (df[col].str.replace('\\', '\\\\', regex=False)
+                          .str.replace('\t', '\\t', regex=False)
+                          .str.replace('\n', '\\n', regex=False)
+                          .str.replace('\r', '\\r', regex=False)
+                          .str.replace('"', '\\"', regex=False))
+    return df
+
+def load_df_to_mysql(cursor, table_name, df, columns):
+    """将数据写入临时TSV文件后通过LOAD DATA LOCAL INFILE一次性导入"""
+    load_sql = (
+        f"LOAD DATA LOCAL INFILE %s IGNORE INTO TABLE `{table_name}` "
+        "FIELDS TERMINATED BY '\\t' ENCLOSED BY '' ESCAPED BY '\\\\' "
+        f"LINES TERMINATED BY '\\n' ({columns})"
+    )
     
-    # 生成插入语句
-    columns = ', '.join([f'`{col}`' for col in df.columns])
+    # 缺失值直接写为\N；特殊字符已预先转义，无需csv引号
+    with tempfile.NamedTemporaryFile('w', suffix='.tsv', encoding='utf-8', newline='') as tmp:
+        escape_load_data_fields(df).to_csv(tmp, sep='\t', index=False, header=False, na_rep='\\N',
+                                           lineterminator='\n', quoting=csv.QUOTE_NONE)
+        tmp.flush()
+        cursor.execute(load_sql, (tmp.name,))
+
+def insert_df_to_mysql(cursor, table_name, df, columns, batch_size=500):
+    """分批执行INSERT IGNORE导入数据（服务器未开启local_infile时使用）"""
     placeholders = ', '.join(['%s'] * len(df.columns))
     insert_sql = f"INSERT IGNORE INTO `{table_name}` ({columns}) VALUES ({placeholders})"
     
-    # 分批插入
+    # 缺失值转换为None
+    rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
     total_rows = len(df)
-    for i in range(0, total_rows, batch_size):
-        batch = df.iloc[i:i+batch_size]
-        data_tuples = [tuple(x) for x in batch.to_records(index=False)]
-        cursor.executemany(insert_sql, data_tuples)
-        print(f"Inserted {min(i+batch_size, total_rows)}/{total_rows} rows")
+    inserted = 0
+    while batch := list(islice(rows, batch_size)):
+        cursor.executemany(insert_sql, batch)
+        inserted += len(batch)
+        print(f"Inserted {inserted}/{total_rows} rows")
+
+def import_df_to_mysql(cursor, table_name, df):
+    """批量导入数据（优先LOAD DATA LOCAL INFILE，服务器禁用时回退到INSERT）"""
+    df = sanitize_column_names(df)
+    columns = ', '.join([f'`{col}`' for col in df.columns])
     
-    print(f"✅ Imported {total_rows} rows into {table_name}")
+    try:
+        load_df_to_mysql(cursor, table_name, df, columns)
+    except Error as e:
+        if e.errno not in LOCAL_INFILE_DISABLED_ERRNOS:
+            raise
+        print(f"⚠️ LOAD DATA LOCAL INFILE unavailable ({e.msg}), falling back to INSERT")
+        insert_df_to_mysql(cursor, table_name, df, columns)
+    
+    print(f"✅ Imported {len(df)} rows into {table_name}")
 
 def main():
     # 命令行参数解析
@@ -99,25 +160,24 @@ def main():
 
     try:
         # 连接数据库
-        connection = mysql.connector.connect(**db_config)
+        connection = mysql.connector.connect(**db_config, allow_local_infile=True)
         cursor = connection.cursor()
         
         # 读取CSV文件
-        df_basic = pd.read_csv(args.basicdata, dtype={
-                'total_size_bp': 'Int64', 
-                'sequences': 'Int64',
-                'n50_bp': 'Int64'
-            })
-        df_supply = pd.read_csv(args.supplydata)
+        df_basic = pd.read_csv(args.basicdata, engine='c',
+                               usecols=list(BASIC_DTYPES), dtype=BASIC_DTYPES)
+        df_supply = pd.read_csv(args.supplydata, engine='c',
+                                usecols=list(SUPPLY_DTYPES), dtype=SUPPLY_DTYPES)
         
         # 创建表结构
         create_tables(cursor, args.outputbasicdata, args.outputsupplydata, args.uniquekey)
         
-        # 导入数据（先基础表后扩增表）
+        # 导入数据（先基础表后扩增表），整体放在单个事务中
+        connection.start_transaction()
         import_df_to_mysql(cursor, args.outputbasicdata, df_basic)
         import_df_to_mysql(cursor, args.outputsupplydata, df_supply)
-        
         connection.commit()
+
         print("✅ Data imported successfully!")
         
     except Error as e:
@@ -1,17 +1,27 @@
 #!/usr/bin/env python3
 import os
 import sys
+import errno
 import gzip
-import glob
 import argparse
 import hashlib
 import shutil 
 import csv
+import json
 import random
 import subprocess
 from datetime import datetime
+from itertools import repeat
+import numpy as np
 from concurrent.futures import ProcessPoolExecutor
 
+STATS_CACHE_NAME = ".md5cache.json"
+PIGZ_PATH = shutil.which("pigz")
+
+# 行首尾需去除的空白字符（与str.strip()的ASCII部分一致，换行符另作行分隔处理）
+STRIP_TABLE = np.zeros(256, dtype=bool)
+STRIP_TABLE[[ord(c) for c in ' \t\x0b\x0c\x1c\x1d\x1e\x1f']] = True
+
 def main():
     # 参数解析扩展
     parser = argparse.ArgumentParser(description="基因组统计与GTDB-Tk并行分类工具")
@@ -22,7 +32,15 @@ def main():
     parser.add_argument("-k", "--keep-temp", default="False", help="保留临时文件(默认:False)")
     parser.add_argument("-r", "--temp-dir", default="/tmp", help="临时目录路径(默认:/tmp)")
     parser.add_argument("-t", "--file-type", choices=["auto", "flat", "nested"], default="auto", help="文件组织结构")
+    parser.add_argument("-a", "--hash-algo", choices=["md5", "xxh3_128"], default="md5", help="文件指纹算法(默认:md5；xxh3_128需安装xxhash，速度更快但结果与MD5不兼容)")
     args = parser.parse_args()
+    
+    # xxhash为可选依赖，在耗时的GTDB-Tk流程开始前检查
+    if args.hash_algo == "xxh3_128":
+        try:
+            import xxhash
+        except ImportError:
+            parser.error("--hash-algo xxh3_128 需要安装xxhash (pip install xxhash)")
 
     # 执行核心流程
     process_files(args)
@@ -31,10 +49,15 @@ def main():
 def run_gtdbtk(task_dir, task_out, file_ext):
     """执行GTDB-Tk分类任务"""
     try:
-        cmd = f"gtdbtk classify_wf --genome_dir {task_dir} --out_dir {task_out} -x {file_ext} --cpus 1 --skip_ani_screen"
-        subprocess.run(cmd, shell=True, check=True)
+        cmd = ["gtdbtk", "classify_wf",
+               "--genome_dir", task_dir,
+               "--out_dir", task_out,
+               "-x", file_ext,
+               "--cpus", "1",
+               "--skip_ani_screen"]
+        subprocess.run(cmd, check=True)
         return True, ""
-    except subprocess.CalledProcessError as e:
+    except (subprocess.CalledProcessError, OSError) as e:
         return False, f"GTDB-Tk失败: {str(e)}"
 
 def parse_gtdb_summary(summary_path, args):
@@ -46,13 +69,20 @@ def parse_gtdb_summary(summary_path, args):
     with open(summary_path) as f:
         reader = csv.DictReader(f, delimiter='\t')
         for row in reader:
+            # 键与暂存文件名(staged_name)一致；分类字符串大量重复，驻留以节省内存
             genome_id = row['user_genome'] + "." + args.extension
-            classifications[genome_id] = row['classification']
+            classifications[genome_id] = sys.intern(row['classification'])
     return classifications
 
+def staged_name(file_path, use_type):
+    """生成文件在任务目录和结果中的名称（嵌套结构加目录前缀）"""
+    if use_type == "nested":
+        return f"{os.path.basename(os.path.dirname(file_path))}_{os.path.basename(file_path)}"
+    return os.path.basename(file_path)
+
 def find_fasta_files(input_dir, file_type):
     """查找所有FASTA文件（新增函数）"""
-    patterns = ["*.fa", "*.fa.gz"]
+    exts = (".fa", ".fa.gz")
     all_files = []
     use_type = file_type
     
@@ -65,14 +95,17 @@ def find_fasta_files(input_dir, file_type):
     elif use_type == "flat":
         print(f"文件结构类型: {use_type}")
     
-    # 文件搜索
-    for pattern in patterns:
-        if use_type == "nested":
-            full_pattern = os.path.join(input_dir, "**", pattern)
-            found_files = glob.glob(full_pattern, recursive=True)
-        elif use_type == "flat":
-            found_files = glob.glob(os.path.join(input_dir, pattern))
-        all_files.extend([f for f in found_files if os.path.isfile(f)])
+    # 文件搜索（单次遍历目录，按后缀过滤，跳过隐藏文件与目录）
+    if use_type == "nested":
+        walker = os.walk(input_dir)
+    else:
+        with os.scandir(input_dir) as it:
+            walker = [(input_dir, [], [e.name for e in it if e.is_file()])]
+    for dir_path, dir_names, file_names in walker:
+        dir_names[:] = [d for d in dir_names if not d.startswith('.')]
+        for file_name in file_names:
+            if file_name.endswith(exts) and not file_name.startswith('.'):
+                all_files.append(os.path.join(dir_path, file_name))
     
     return all_files, use_type
 
@@ -83,84 +116,132 @@ def detect_file_type(input_dir):
             return "nested"
     return "flat"
 
-def calculate_md5(file_path):
-    """计算文件的MD5校验值"""
-    hash_md5 = hashlib.md5()
-    try:
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
-    except Exception as e:
-        return f"MD5_ERROR: {str(e)}"
-
 def calculate_n50_l50(lengths, total_bp):
     """计算N50和L50指标"""
-    if not lengths:
+    if len(lengths) == 0:
         return 0, 0
     
-    sorted_lengths = sorted(lengths, reverse=True)
-    half_total = total_bp / 2
-    cumulative = 0
-    for i, seq_len in enumerate(sorted_lengths, 1):
-        cumulative += seq_len
-        if cumulative >= half_total:
-            return seq_len, i
-    return sorted_lengths[0], 1
-
-def calc_stats(file_handle):
-    """计算FASTA文件的组装指标"""
-    total_bp = 0
-    seq_lengths = []
-    current_length = 0
-    seq_count = 0
+    # 降序排列后累加，首个累计长度达到总长一半的位置即为L50
+    sorted_lengths = np.sort(np.asarray(lengths, dtype=np.int64))[::-1]
+    cumulative = np.cumsum(sorted_lengths)
+    idx = int(np.searchsorted(cumulative, total_bp / 2))
+    if idx >= sorted_lengths.size:
+        return int(sorted_lengths[0]), 1
+    return int(sorted_lengths[idx]), idx + 1
 
-    for line in file_handle:
-        if isinstance(line, bytes):
-            line = line.decode('utf-8', errors='ignore')
-        line = line.strip()
-        
-        if line.startswith('>'):
-            if current_length > 0:
-                seq_lengths.append(current_length)
-                total_bp += current_length
-                seq_count += 1
-            current_length = 0
-        elif line:  # 忽略空行
-            current_length += len(line)
+def calc_stats_bytes(buf):
+    """计算FASTA文件的组装指标（基于整块字节数据的向量化实现）"""
+    arr = np.frombuffer(buf, dtype=np.uint8)
+    if arr.size == 0:
+        return (0, 0, 0, 0, 0, 0)
+    
+    # 按换行符切分行（\n、\r、\r\n均视为换行，\r\n之间的空行不影响统计），行区间为[starts, ends)
+    newlines = np.flatnonzero((arr == ord('\n')) | (arr == ord('\r')))
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.concatenate((newlines, [arr.size]))
+    if starts[-1] == arr.size:  # 末尾换行后的空行
+        starts, ends = starts[:-1], ends[:-1]
+    
+    # 统计每行首尾连续空白字符数：空白字符在行内的序号与其距行首（或行尾）的距离相等即为首（尾）部空白
+    blanks = np.flatnonzero(STRIP_TABLE[arr])
+    blank_lines = np.searchsorted(starts, blanks, side='right') - 1
+    blank_counts = np.bincount(blank_lines, minlength=starts.size)
+    blank_rank = np.arange(blanks.size) - np.searchsorted(blank_lines, blank_lines)
+    leading = np.bincount(blank_lines[blanks - starts[blank_lines] == blank_rank],
+                          minlength=starts.size)
+    trailing = np.bincount(blank_lines[ends[blank_lines] - 1 - blanks
+                                       == blank_counts[blank_lines] - 1 - blank_rank],
+                           minlength=starts.size)
+    
+    # 每行有效长度 = 去除首尾空白后的行长（全空白行首尾重复计数，截断为0）
+    line_lengths = np.maximum((ends - starts) - leading - trailing, 0)
     
-    if current_length > 0:
-        seq_lengths.append(current_length)
-        total_bp += current_length
-        seq_count += 1
+    # 去除首部空白后以'>'开头的行为序列头，序列长度为其后各行长度之和
+    is_header = np.zeros(starts.size, dtype=bool)
+    non_empty = line_lengths > 0
+    is_header[non_empty] = arr[(starts + leading)[non_empty]] == ord('>')
+    seq_ids = np.cumsum(is_header)
+    seq_lengths = np.bincount(seq_ids[~is_header], weights=line_lengths[~is_header],
+                              minlength=seq_ids[-1] + 1).astype(np.int64)
+    seq_lengths = seq_lengths[seq_lengths > 0]  # 忽略空序列
     
     # 空文件处理
+    seq_count = int(seq_lengths.size)
     if seq_count == 0:
         return (0, 0, 0, 0, 0, 0)
     
-    max_len = max(seq_lengths) if seq_lengths else 0
-    min_len = min(seq_lengths) if seq_lengths else 0
+    total_bp = int(seq_lengths.sum())
+    max_len = int(seq_lengths.max())
+    min_len = int(seq_lengths.min())
     n50, l50 = calculate_n50_l50(seq_lengths, total_bp)
     
     return (total_bp, seq_count, max_len, min_len, n50, l50)
 
-def calculate_file_stats(file_path):
-    """封装函数：计算文件统计信息"""
-    md5_val = calculate_md5(file_path)
+def calculate_digest(data, hash_algo="md5"):
+    """计算文件内容指纹（默认MD5，可选xxh3_128）"""
+    if hash_algo == "xxh3_128":
+        import xxhash
+        return xxhash.xxh3_128(data).hexdigest()
+    return hashlib.md5(data).hexdigest()
+
+def decompress_gzip(raw):
+    """解压gzip数据，优先使用pigz，不可用或失败时退回gzip模块"""
+    if PIGZ_PATH:
+        proc = subprocess.run([PIGZ_PATH, "-dc"], input=raw,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        if proc.returncode == 0:
+            return proc.stdout
+    return gzip.decompress(raw)
+
+def calculate_file_stats(file_path, hash_algo="md5"):
+    """封装函数：单次读取文件，同时计算MD5与统计信息"""
+    with open(file_path, 'rb') as fh:
+        raw = fh.read()
     
-    if file_path.endswith('.gz'):
-        with gzip.open(file_path, 'rt') as fh:
-            stats = calc_stats(fh)
-    else:
-        with open(file_path, 'r') as fh:
-            stats = calc_stats(fh)
+    # MD5基于原始文件内容（.gz文件即压缩数据），解压在内存中完成
+    md5_val = calculate_digest(raw, hash_algo)
+    buf = decompress_gzip(raw) if file_path.endswith('.gz') else raw
+    
+    return (md5_val,) + calc_stats_bytes(buf)
+
+def stage_file(src_path, dest_path):
+    """将文件放入任务目录：GTDB-Tk只读取文件，优先硬链接，其次软链接，最后在内核态复制"""
+    # 仅在跨文件系统或无权限时退回下一种方式；目标已存在等其他错误直接抛出，避免经已有链接覆盖输入文件
+    try:
+        os.link(src_path, dest_path)
+        return
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM):
+            raise
+    try:
+        os.symlink(src_path, dest_path)
+        return
+    except OSError as e:
+        if e.errno != errno.EPERM:
+            raise
     
-    return (md5_val,) + stats
+    with open(src_path, 'rb') as src, open(dest_path, 'xb') as dst:
+        size = os.fstat(src.fileno()).st_size
+        offset = 0
+        while offset < size:
+            sent = os.sendfile(dst.fileno(), src.fileno(), offset, size - offset)
+            if sent == 0:
+                break
+            offset += sent
 
 def process_files(args):
     """处理主流程"""
     # 文件搜索与类型检测
     all_files, use_type = find_fasta_files(args.input_dir, args.file_type)
+    
+    # 不同输入文件映射为同一名称时，分类结果无法区分且暂存时会相互冲突
+    staged_sources = {}
+    for file_path in all_files:
+        name = staged_name(file_path, use_type)
+        if name in staged_sources:
+            print(f"错误：文件名冲突 {staged_sources[name]} 与 {file_path} 均映射为 {name}")
+            sys.exit(1)
+        staged_sources[name] = file_path
     if int(args.threads) > len(all_files):
         print(f"实际文件数{len(all_files)}小于线程数{args.threads}")
         args.threads = len(all_files)
@@ -177,21 +258,15 @@ def process_files(args):
         os.makedirs(task_dir, exist_ok=True)
         task_dirs.append(task_dir)
     
-    # 文件分配到任务目录（使用文件复制而非软链接）
+    # 文件分配到任务目录
     for idx, file_path in enumerate(all_files):
         task_idx = idx % args.threads
-        if use_type == "nested":
-            # 文件路径+文件名
-            dest_name = os.path.basename(os.path.dirname(file_path)) + "_" +os.path.basename(file_path)
-        else:
-            dest_name = os.path.basename(file_path)
-        dest_path = os.path.join(task_dirs[task_idx], dest_name)
+        dest_path = os.path.join(task_dirs[task_idx], staged_name(file_path, use_type))
         
         try:
-            # 使用shutil.copy2进行文件复制（保留元数据）
-            shutil.copy2(os.path.abspath(file_path), dest_path)
+            stage_file(os.path.abspath(file_path), dest_path)
         except Exception as e:
-            print(f"错误：复制文件失败 {file_path} -> {dest_path}: {str(e)}")
+            print(f"错误：链接文件失败 {file_path} -> {dest_path}: {str(e)}")
             sys.exit(1)
     
     # 并行执行GTDB-Tk
@@ -211,48 +286,89 @@ def process_files(args):
     # 合并分类结果
     all_classifications = {}
     for task_out in task_outputs:
-        bac_file = os.path.join(task_out, "gtdbtk.bac120.summary.tsv")
-        arc_file = os.path.join(task_out, "gtdbtk.ar53.summary.tsv")
-        
-        if os.path.exists(bac_file):
-            all_classifications.update(parse_gtdb_summary(bac_file, args))
-        if os.path.exists(arc_file):
-            all_classifications.update(parse_gtdb_summary(bac_file, args))
+        for summary in ("gtdbtk.bac120.summary.tsv", "gtdbtk.ar53.summary.tsv"):
+            summary_path = os.path.join(task_out, summary)
+            if os.path.exists(summary_path):
+                all_classifications.update(parse_gtdb_summary(summary_path, args))
     
-    # 生成最终CSV (扩展分类列)
-    generate_final_csv(all_files, args.output_file, all_classifications, args.file_type)
+    # 生成最终CSV (扩展分类列)，未变化文件的MD5与统计结果直接取自缓存
+    cache_path = os.path.join(os.path.dirname(os.path.abspath(args.output_file)), STATS_CACHE_NAME)
+    stats_cache = generate_final_csv(all_files, args.output_file, all_classifications, use_type,
+                                     load_stats_cache(cache_path), args.hash_algo, args.threads)
+    save_stats_cache(cache_path, stats_cache)
     
     # 清理临时文件
     if args.keep_temp != False :
         print(f"清理临时目录: {temp_root}")
         shutil.rmtree(temp_root)
 
-def generate_final_csv(file_list, output_path, classifications, file_type):
-    """生成带分类结果的CSV文件"""
-    with open(output_path, 'w') as f:
-        f.write("fasta_file_name,fasta_file_md5,total_size(bp),sequences,largest_seq(bp),smallest_seq(bp),N50(bp),L50,classification\n")
+def stats_cache_key(file_path, hash_algo="md5"):
+    """生成缓存键：指纹算法:绝对路径:修改时间(ns):文件大小"""
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return f"{hash_algo}:{os.path.abspath(file_path)}:{st.st_mtime_ns}:{st.st_size}"
+
+def load_stats_cache(cache_path):
+    """加载MD5与统计信息缓存"""
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_stats_cache(cache_path, cache):
+    """保存MD5与统计信息缓存"""
+    try:
+        with open(cache_path, 'w') as f:
+            json.dump(cache, f)
+    except OSError as e:
+        print(f"警告: 保存缓存失败 {cache_path}: {str(e)}")
+
+def stats_one_file(file_path, use_type, hash_algo="md5"):
+    """计算单个文件的统计信息（供进程池调用）"""
+    file_name = staged_name(file_path, use_type)
+    
+    try:
+        return file_name, calculate_file_stats(file_path, hash_algo), None
+    except Exception as e:
+        return file_name, None, str(e)
+
+def generate_final_csv(file_list, output_path, classifications, use_type, stats_cache=None, hash_algo="md5", threads=1):
+    """生成带分类结果的CSV文件，返回本次运行涉及文件的统计缓存"""
+    stats_cache = stats_cache or {}
+    cache_keys = [stats_cache_key(file_path, hash_algo) for file_path in file_list]
+    cached = [stats_cache.get(key) for key in cache_keys]
+    # 新缓存只保留本次运行涉及的文件，避免无限增长
+    new_cache = {}
+    # 缓存命中的文件在主进程直接取结果，仅未命中的文件提交进程池
+    misses = [file_path for file_path, stats in zip(file_list, cached) if stats is None]
+    
+    # 每个工作进程需容纳整个文件及其解压数据，进程数受-j/--threads限制以控制内存峰值
+    with open(output_path, 'w', newline='', buffering=1 << 20) as f, ProcessPoolExecutor(max_workers=max(1, threads)) as executor:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(["fasta_file_name", "fasta_file_md5", "total_size(bp)", "sequences", "largest_seq(bp)",
+                         "smallest_seq(bp)", "N50(bp)", "L50", "classification"])
         
-        for file_path in file_list:
-            # 文件名处理
-            if file_type == "nested":
-                dir_name = os.path.basename(os.path.dirname(file_path))
-                file_name = f"{dir_name}_{os.path.basename(file_path)}"
+        # 各文件的MD5与统计计算互不依赖，按输入顺序并行获取结果
+        computed = executor.map(stats_one_file, misses, repeat(use_type), repeat(hash_algo), chunksize=16)
+        for file_path, key, stats in zip(file_list, cache_keys, cached):
+            if stats is not None:
+                file_name, stats, error = staged_name(file_path, use_type), tuple(stats), None
             else:
-                file_name = os.path.basename(file_path)
-            
-            # 获取分类结果
-            classification = classifications.get(file_name, "Not Found")
-            
-            try:
-                # 计算文件统计信息
-                stats = calculate_file_stats(file_path)
-                # 写入CSV行
-                f.write(f"{file_name},{','.join(map(str, stats))},{classification}\n")
-            except Exception as e:
-                print(f"处理文件 {file_path} 时出错：{str(e)}")
+                file_name, stats, error = next(computed)
+            if error is None:
+                if key is not None:
+                    new_cache[key] = list(stats)
+                # 获取分类结果并写入CSV行
+                writer.writerow((file_name, *stats, classifications.get(file_name, "Not Found")))
+            else:
+                print(f"处理文件 {file_path} 时出错：{error}")
                 # 写入错误占位符
-                error_stats = (f"ERROR-{str(e)[:30]}", 0, 0, 0, 0, 0, 0)
-                f.write(f"{file_name},{','.join(map(str, error_stats))},ERROR\n")
+                writer.writerow((file_name, f"ERROR-{error[:30]}", 0, 0, 0, 0, 0, 0, "ERROR"))
+    
+    return new_cache
 
 if __name__ == "__main__":
     main()
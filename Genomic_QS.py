@@ -9,15 +9,27 @@ Date: 2025-07-24
 """
 import os
 import sys
+import errno
 import argparse
+import copy
 import hashlib
 import subprocess
 import tempfile
 import shutil
-import csv
-import glob
-from collections import OrderedDict
-import pandas as pd
+import threading
+import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+import numpy as np
+
+MD5_CACHE_NAME = ".genomic_qs_md5cache.json"
+# 并行计算MD5的最大线程数
+MD5_MAX_WORKERS = 4
+
+# MIMAG质量分级阈值（逐级嵌套）：(最低完整度, 最高污染度)，满足的级数即标签下标
+QUALITY_MIN_COMPLETENESS = np.array([50, 70, 90])
+QUALITY_MAX_CONTAMINATION = np.array([10, 10, 5])
+QUALITY_LABELS = np.array(["low-quality", "medium-quality", "high-quality", "near-complete", "NA"])
 
 def parse_arguments():
     """Parse command-line arguments"""
@@ -44,6 +56,9 @@ def parse_arguments():
                         help="Number of files to process per batch (0=process all at once)")
     parser.add_argument("-r", "--custom-temp-root", default="/tmp",
                         help="Custom root directory for temporary files (default: /tmp)")
+    parser.add_argument("-p", "--parallel-batches", type=int, default=1,
+                        help="Number of batches to run concurrently when --batch-size is set; "
+                             "CPU threads are split evenly between them")
     return parser.parse_args()
 
 def detect_structure(input_dir, structure_type):
@@ -51,29 +66,57 @@ def detect_structure(input_dir, structure_type):
     if structure_type != "auto":
         return structure_type
         
-    subdirs = [d for d in os.listdir(input_dir) 
-              if os.path.isdir(os.path.join(input_dir, d))]
-    return "nested" if subdirs else "flat"
+    # 找到第一个子目录即可判定为嵌套结构
+    with os.scandir(input_dir) as it:
+        for entry in it:
+            if entry.is_dir():
+                return "nested"
+    return "flat"
 
 def calculate_md5(file_path):
     """Calculate MD5 checksum for a file (supports gzip)"""
-    hash_md5 = hashlib.md5()
     with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
+        # Python 3.11+ 在C层以大缓冲区完成哈希
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, "md5").hexdigest()
+        hash_md5 = hashlib.md5()
+        for chunk in iter(lambda: f.read(1 << 20), b""):
             hash_md5.update(chunk)
     return hash_md5.hexdigest()
 
-def classify_quality(completeness, contamination):
-    """Classify genome quality based on MIMAG standards"""
-    qs = completeness - 5 * contamination
-    if completeness >= 90 and contamination <= 5:
-        return "near-complete", qs
-    elif completeness >= 70 and contamination <= 10:
-        return "high-quality", qs
-    elif completeness >= 50 and contamination <= 10:
-        return "medium-quality", qs
-    else:
-        return "low-quality", qs
+def md5_cache_key(file_path):
+    """Build the MD5 cache key: absolute path, mtime (ns) and size"""
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return f"{os.path.abspath(file_path)}:{st.st_mtime_ns}:{st.st_size}"
+
+def load_md5_cache(cache_path):
+    """Load cached MD5 values"""
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_md5_cache(cache_path, cache):
+    """Save cached MD5 values"""
+    try:
+        with open(cache_path, "w") as f:
+            json.dump(cache, f)
+    except OSError as e:
+        print(f"警告: 保存MD5缓存失败 {cache_path}: {str(e)}")
+
+def drain_pipe(pipe, sink=None, chunks=None):
+    """Read a subprocess pipe in 64 KiB chunks until EOF, forwarding and/or collecting the data"""
+    for chunk in iter(lambda: pipe.read1(65536), b""):
+        if sink is not None:
+            sink.write(chunk)
+            sink.flush()
+        if chunks is not None:
+            chunks.append(chunk)
+    pipe.close()
 
 def run_checkm(input_dir, output_dir, checkm_db, threads, extension):
     """Run CheckM analysis on genome collection"""
@@ -103,22 +146,25 @@ def run_checkm(input_dir, output_dir, checkm_db, threads, extension):
             lineage_cmd,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
-            text=True,
             env=env
         )
         
-        # 实时输出进度
-        while True:
-            output = process.stdout.readline()
-            if output == '' and process.poll() is not None:
-                break
-            if output:
-                print(output.strip())
-                
+        # 两个管道分别由线程持续读取：stdout实时输出进度，stderr收集备用，避免管道写满导致CheckM阻塞
+        sys.stdout.flush()
+        stderr_chunks = []
+        readers = [
+            threading.Thread(target=drain_pipe, args=(process.stdout, sys.stdout.buffer)),
+            threading.Thread(target=drain_pipe, args=(process.stderr, None, stderr_chunks))
+        ]
+        for reader in readers:
+            reader.start()
+        
         # 检查返回码
         return_code = process.wait()
+        for reader in readers:
+            reader.join()
         if return_code != 0:
-            error_output = process.stderr.read()
+            error_output = b"".join(stderr_chunks).decode(errors="replace")
             print(f"CheckM错误输出:\n{error_output}")
             raise subprocess.CalledProcessError(return_code, lineage_cmd, output=error_output)
             
@@ -148,65 +194,116 @@ def run_checkm(input_dir, output_dir, checkm_db, threads, extension):
 
 def parse_checkm_results(result_file):
     """Parse CheckM results into structured data"""
-    results = {}
+    # pandas仅在解析结果时才需要，延迟导入以加快启动（如 --help）
+    import pandas as pd
     with open(result_file, "r") as f:
-        lines = f.readlines()
-    
-    # Find the start of the tabular data
-    start_index = 0
-    for i, line in enumerate(lines):
-        if line.startswith("Bin Id"):
-            start_index = i
-            break
-    
-    if start_index == 0:
-        raise ValueError("CheckM results format error: No header found")
-    
-    # Parse header and data
-    header = lines[start_index].strip().split("\t")
-    completeness_idx = header.index("Completeness")
-    contamination_idx = header.index("Contamination")
-    
-    for line in lines[start_index+1:]:
-        if not line.strip():
-            continue
-        fields = line.strip().split("\t")
-        bin_id = fields[0]
+        # 逐行读取至表头行，其余内容由同一文件句柄交给pandas C解析器
+        for line in f:
+            if line.startswith("Bin Id"):
+                header = line.rstrip("\r\n").split("\t")
+                break
+        else:
+            raise ValueError("CheckM results format error: No header found")
+        
         try:
-            completeness = float(fields[completeness_idx].rstrip('%'))
-            contamination = float(fields[contamination_idx].rstrip('%'))
-            results[bin_id] = (completeness, contamination)
-        except (ValueError, IndexError):
-            continue
+            df = pd.read_csv(f, sep="\t", header=None, names=header, dtype=str,
+                             usecols=["Bin Id", "Completeness", "Contamination"])
+        except pd.errors.EmptyDataError:
+            return {}
+    completeness = pd.to_numeric(df["Completeness"].str.rstrip("%"), errors="coerce")
+    contamination = pd.to_numeric(df["Contamination"].str.rstrip("%"), errors="coerce")
+    valid = completeness.notna() & contamination.notna()
     
-    return results
+    return dict(zip(df.loc[valid, "Bin Id"],
+                    zip(completeness[valid].tolist(), contamination[valid].tolist())))
 
-def process_batch(genomes_batch, batch_idx, temp_dir, args, dir_structure):
-    """Process a batch of genomes"""
-    # 创建当前批次的临时目录
-    batch_genome_dir = os.path.join(temp_dir, f"genomes_batch_{batch_idx}")
-    os.makedirs(batch_genome_dir, exist_ok=True)
+def scan_genome_files(dir_path, extension):
+    """List genome files with the given extension (single scandir pass)"""
+    suffix = "." + extension
+    with os.scandir(dir_path) as it:
+        return [entry.path for entry in it
+                if entry.name.endswith(suffix) and not entry.name.startswith(".") and entry.is_file()]
+
+def copy_and_md5(src_path, dest_path):
+    """Copy a file and compute its MD5 in the same pass"""
+    hash_md5 = hashlib.md5()
+    with open(src_path, "rb") as fsrc, open(dest_path, "wb") as fdst:
+        while buf := fsrc.read(1 << 20):
+            fdst.write(buf)
+            hash_md5.update(buf)
+    return hash_md5.hexdigest()
+
+def stage_genome(src_path, dest_path):
+    """Place a genome in the batch directory, return its MD5 if it was copied"""
+    # CheckM只读取文件内容，硬链接不占用额外磁盘空间；跨文件系统或无权限时退回复制，复制时顺带计算MD5
+    try:
+        os.link(src_path, dest_path)
+        return None
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM):
+            raise
+        return copy_and_md5(src_path, dest_path)
+
+def prepare_batch(genomes_batch, batch_idx, temp_dir, args, dir_structure):
+    """Stage a batch of genomes into its temporary directory and compute MD5s"""
+    print(f"\n=== 开始处理批次 {batch_idx} ({len(genomes_batch)} 个文件) ===")
+    if dir_structure == "flat" and batch_idx == 0:
+        # 扁平目录一次性处理时文件名无需加前缀，CheckM直接读取输入目录，跳过暂存
+        for genome in genomes_batch:
+            genome["prefixed_name"] = os.path.basename(genome["src_path"])
+        batch_genome_dir = args.input
+    else:
+        # 创建当前批次的临时目录
+        batch_genome_dir = os.path.join(temp_dir, f"genomes_batch_{batch_idx}")
+        os.makedirs(batch_genome_dir, exist_ok=True)
     
-    batch_results = []
-    for genome in genomes_batch:
-        # 关键修改：根据目录结构生成新文件名
-        if dir_structure == "nested":
-            # 使用文件夹名_文件名格式
-            new_file_name = f"{genome['parent_dir']}_{os.path.basename(genome['src_path'])}"
-        else:
-            new_file_name = os.path.basename(genome['src_path'])
+        staged = 0
+        staged_sources = {}
+        for i, genome in enumerate(genomes_batch, 1):
+            # 关键修改：根据目录结构生成新文件名
+            if dir_structure == "nested":
+                # 使用文件夹名_文件名格式
+                new_file_name = f"{genome['parent_dir']}_{os.path.basename(genome['src_path'])}"
+            else:
+                new_file_name = os.path.basename(genome['src_path'])
         
-        temp_path = os.path.join(batch_genome_dir, new_file_name)
-        try:
-            shutil.copy2(genome["src_path"], temp_path)
-            print(f"复制批次 {batch_idx}: {genome['src_path']} → {temp_path}")
-        except Exception as e:
-            print(f"复制错误: {e}")
-            continue
+            # 保存带前缀的文件名用于后续结果关联（复制失败时该基因组结果记为NA）
+            genome["prefixed_name"] = new_file_name
+            temp_path = os.path.join(batch_genome_dir, new_file_name)
+            try:
+                md5 = stage_genome(genome["src_path"], temp_path)
+            except FileExistsError:
+                # 不同基因组映射为同一带前缀文件名，CheckM结果将无法区分
+                raise RuntimeError(f"文件名冲突: {staged_sources.get(new_file_name, temp_path)} 与 "
+                                   f"{genome['src_path']} 均映射为 {new_file_name}") from None
+            except Exception as e:
+                print(f"复制错误: {genome['src_path']}: {e}")
+                continue
         
-        # 保存带前缀的文件名用于后续结果关联
-        genome["prefixed_name"] = new_file_name
+            staged_sources[new_file_name] = genome["src_path"]
+            if md5 is not None:
+                genome["md5"] = md5
+        
+            # 汇总输出进度，避免逐文件打印
+            staged += 1
+            if i % 500 == 0:
+                print(f"复制批次 {batch_idx}: 已处理 {i}/{len(genomes_batch)} 个文件")
+    
+        print(f"复制批次 {batch_idx}: 共复制 {staged}/{len(genomes_batch)} 个文件至 {batch_genome_dir}")
     
+    # 未经复制的文件尚未读取，其MD5互不依赖，使用线程池并行计算
+    # （hashlib计算时释放GIL；预取线程中不能fork进程池，且少量线程即可跑满磁盘，避免与CheckM争抢CPU）
+    pending = [genome for genome in genomes_batch if "md5" not in genome]
+    if pending:
+        paths = [genome["src_path"] for genome in pending]
+        with ThreadPoolExecutor(max_workers=min(args.threads, MD5_MAX_WORKERS)) as executor:
+            for genome, md5 in zip(pending, executor.map(calculate_md5, paths)):
+                genome["md5"] = md5
+    return batch_genome_dir
+
+def analyze_batch(genomes_batch, batch_idx, batch_genome_dir, temp_dir, args):
+    """Run CheckM on a staged batch and build its quality table"""
+    import pandas as pd
     # 运行CheckM分析
     checkm_output = os.path.join(temp_dir, f"checkm_output_batch_{batch_idx}")
     os.makedirs(checkm_output, exist_ok=True)
@@ -215,36 +312,55 @@ def process_batch(genomes_batch, batch_idx, temp_dir, args, dir_structure):
     # 解析CheckM结果
     checkm_results = parse_checkm_results(result_file)
     
-    # 准备当前批次结果
-    for genome in genomes_batch:
-        # 使用带前缀的文件名（去掉扩展名）作为匹配键
-        base_name = os.path.splitext(genome["prefixed_name"])[0]
-        
-        if base_name in checkm_results:
-            completeness, contamination = checkm_results[base_name]
-            quality_class, qs = classify_quality(completeness, contamination)
-        else:
-            completeness, contamination, quality_class, qs = "NA", "NA", "NA", "NA"
-        
-        batch_results.append(OrderedDict([
-            ("batch", batch_idx),
-            ("fasta_file_name", genome["prefixed_name"]),  # 使用带前缀的文件名
-            ("fasta_file_md5", genome["md5"]),
-            ("completeness(%)", completeness),
-            ("contamination(%)", contamination),
-            ("QS", qs),
-            ("quality_class", quality_class)
-        ]))
+    # 准备当前批次结果：使用带前缀的文件名（去掉扩展名）作为匹配键
+    scores = [checkm_results.get(os.path.splitext(genome["prefixed_name"])[0], (np.nan, np.nan))
+              for genome in genomes_batch]
+    batch_df = pd.DataFrame({
+        "fasta_file_name": [genome["prefixed_name"] for genome in genomes_batch],  # 使用带前缀的文件名
+        "fasta_file_md5": [genome["md5"] for genome in genomes_batch],
+        "completeness(%)": [completeness for completeness, _ in scores],
+        "contamination(%)": [contamination for _, contamination in scores]
+    })
     
-    # 保存当前批次结果到临时文件
-    batch_output = os.path.join(temp_dir, f"batch_{batch_idx}_results.csv")
-    with open(batch_output, "w") as out_fh:
-        writer = csv.DictWriter(out_fh, fieldnames=batch_results[0].keys())
-        writer.writeheader()
-        writer.writerows(batch_results)
+    # 按MIMAG标准向量化计算QS与质量分级
+    completeness = batch_df["completeness(%)"].to_numpy()
+    contamination = batch_df["contamination(%)"].to_numpy()
+    batch_df["QS"] = completeness - 5 * contamination
+    tier = ((completeness[:, None] >= QUALITY_MIN_COMPLETENESS) &
+            (contamination[:, None] <= QUALITY_MAX_CONTAMINATION)).sum(axis=1)
+    tier[np.isnan(completeness)] = len(QUALITY_LABELS) - 1
+    batch_df["quality_class"] = QUALITY_LABELS[tier]
     
     print(f"批次 {batch_idx} 完成，处理了 {len(genomes_batch)} 个基因组")
-    return batch_output
+    return batch_df
+
+def process_batch(genomes_batch, batch_idx, temp_dir, args, dir_structure):
+    """Process a batch of genomes"""
+    batch_genome_dir = prepare_batch(genomes_batch, batch_idx, temp_dir, args, dir_structure)
+    return analyze_batch(genomes_batch, batch_idx, batch_genome_dir, temp_dir, args)
+
+def run_batches_parallel(batches, temp_dir, args, dir_structure, n_parallel):
+    """Run several batches concurrently, yielding results in batch order"""
+    # 线程数按并行批次数均分
+    batch_args = copy.copy(args)
+    batch_args.threads = max(1, args.threads // n_parallel)
+    print(f"并行运行 {n_parallel} 个批次，每批次使用 {batch_args.threads} 个线程")
+    
+    with ProcessPoolExecutor(max_workers=n_parallel) as executor:
+        yield from executor.map(process_batch, batches, range(1, len(batches) + 1),
+                                repeat(temp_dir), repeat(batch_args), repeat(dir_structure))
+
+def run_batches_prefetched(batches, temp_dir, args, dir_structure):
+    """Run batches one at a time, staging the next batch while CheckM runs"""
+    # CheckM运行期间磁盘基本空闲，后台线程提前复制下一批次文件并计算MD5
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        pending = prefetcher.submit(prepare_batch, batches[0], 1, temp_dir, args, dir_structure)
+        for batch_idx, genomes_batch in enumerate(batches, 1):
+            batch_genome_dir = pending.result()
+            if batch_idx < len(batches):
+                pending = prefetcher.submit(prepare_batch, batches[batch_idx], batch_idx + 1,
+                                            temp_dir, args, dir_structure)
+            yield analyze_batch(genomes_batch, batch_idx, batch_genome_dir, temp_dir, args)
 
 def process_genomes(args):
     """Main processing workflow"""
@@ -267,44 +383,31 @@ def process_genomes(args):
     # 收集所有基因组文件
     print(f"使用文件扩展名: {args.extension}")
     all_genomes = []
-    found_files = 0
     
     if dir_structure == "flat":
-        pattern = os.path.join(args.input, f"*.{args.extension}")
-        files = glob.glob(pattern)
+        files = scan_genome_files(args.input, args.extension)
         print(f"找到 {len(files)} 个匹配 {args.extension} 扩展名的文件")
         
         for file_path in files:
-            if not os.path.isfile(file_path):
-                continue
             all_genomes.append({
                 "src_path": file_path,
-                "md5": calculate_md5(file_path),
                 "parent_dir": None  # 扁平结构没有父目录
             })
-            found_files += 1
     
     else:  # 嵌套结构
-        for sample_dir in os.listdir(args.input):
-            sample_path = os.path.join(args.input, sample_dir)
-            if not os.path.isdir(sample_path):
-                continue
-            
-            pattern = os.path.join(sample_path, f"*.{args.extension}")
-            files = glob.glob(pattern)
-            print(f"样本 '{sample_dir}' 找到 {len(files)} 个匹配 {args.extension} 扩展名的文件")
+        with os.scandir(args.input) as it:
+            sample_dirs = [entry for entry in it if entry.is_dir()]
+        for sample_entry in sample_dirs:
+            files = scan_genome_files(sample_entry.path, args.extension)
+            print(f"样本 '{sample_entry.name}' 找到 {len(files)} 个匹配 {args.extension} 扩展名的文件")
             
             for file_path in files:
-                if not os.path.isfile(file_path):
-                    continue
                 all_genomes.append({
                     "src_path": file_path,
-                    "md5": calculate_md5(file_path),
-                    "parent_dir": sample_dir  # 记录父目录名
+                    "parent_dir": sample_entry.name  # 记录父目录名
                 })
-                found_files += 1
     
-    if found_files == 0:
+    if not all_genomes:
         raise FileNotFoundError(
             f"在 {args.input} 中未找到基因组文件\n"
             f"使用的扩展名: {args.extension}\n"
@@ -315,105 +418,67 @@ def process_genomes(args):
     
     print(f"共找到 {len(all_genomes)} 个基因组文件")
     
+    # 未变化的文件（路径、修改时间、大小均相同）直接复用缓存的MD5
+    md5_cache_path = os.path.join(os.path.dirname(os.path.abspath(args.output)), MD5_CACHE_NAME)
+    md5_cache = load_md5_cache(md5_cache_path)
+    for genome in all_genomes:
+        genome["cache_key"] = md5_cache_key(genome["src_path"])
+        if genome["cache_key"] in md5_cache:
+            genome["md5"] = md5_cache[genome["cache_key"]]
+    
+    # 准备输出文件，各批次结果完成后直接追加写入
+    output_dir = os.path.dirname(args.output) or '.' 
+    os.makedirs(output_dir, exist_ok=True)
+    
+    if not os.access(output_dir, os.W_OK):
+        raise PermissionError(f"输出目录不可写: {output_dir}")
+    
     # 批次处理逻辑
-    batch_results_files = []
     batch_size = args.batch_size if args.batch_size > 0 else len(all_genomes)
+    written = 0
     
-    if batch_size == len(all_genomes):
-        print(f"一次性处理所有 {len(all_genomes)} 个文件")
-        batch_output = process_batch(all_genomes, 0, temp_dir, args, dir_structure)
-        batch_results_files.append(batch_output)
-    else:
-        print(f"将 {len(all_genomes)} 个文件分成 {len(all_genomes)//batch_size + 1} 批次，每批 {batch_size} 个")
-        
-        for i in range(0, len(all_genomes), batch_size):
-            batch_idx = i // batch_size + 1
-            batch_end = min(i + batch_size, len(all_genomes))
-            genomes_batch = all_genomes[i:batch_end]
-            
-            print(f"\n=== 开始处理批次 {batch_idx} ({len(genomes_batch)} 个文件) ===")
-            batch_output = process_batch(genomes_batch, batch_idx, temp_dir, args, dir_structure)
-            batch_results_files.append(batch_output)
-    
-    # 合并所有批次结果
-    final_results = []
-    for batch_file in batch_results_files:
-        try:
-            print(f"正在加载: {batch_file}")
-            
-            # 调试：检查文件内容前10行
-            with open(batch_file, 'r') as f:
-                head = [next(f) for _ in range(5)]
-            print("文件前5行内容:")
-            print(''.join(head))
-            
-            # 尝试加载CSV文件
-            df = pd.read_csv(batch_file)
-            print(f"成功加载: {batch_file} (形状: {df.shape})")
-            final_results.append(df)
+    with open(args.output, "w", newline="") as out_fh:
+        if batch_size == len(all_genomes):
+            print(f"一次性处理所有 {len(all_genomes)} 个文件")
+            batch_df = process_batch(all_genomes, 0, temp_dir, args, dir_structure)
+            batch_df.to_csv(out_fh, index=False, na_rep="NA")
+            written += len(batch_df)
+        else:
+            batches = [all_genomes[i:i + batch_size] for i in range(0, len(all_genomes), batch_size)]
+            print(f"将 {len(all_genomes)} 个文件分成 {len(batches)} 批次，每批 {batch_size} 个")
             
-        except Exception as e:
-            print(f"加载 {batch_file} 失败: {str(e)}")
-            print("尝试使用替代方法1加载...")
+            # 多个批次可并行运行CheckM，否则逐批运行并预取下一批次
+            n_parallel = max(1, min(args.parallel_batches, len(batches)))
+            if n_parallel > 1:
+                results = run_batches_parallel(batches, temp_dir, args, dir_structure, n_parallel)
+            else:
+                results = run_batches_prefetched(batches, temp_dir, args, dir_structure)
             
-            # 方法1：尝试指定dtype为object
-            try:
-                df = pd.read_csv(batch_file, dtype='object')
-                print(f"使用dtype='object'成功加载: {batch_file}")
-                final_results.append(df)
-            except Exception as e2:
-                print(f"替代方法1失败: {str(e2)}")
-                print("尝试使用替代方法2加载...")
-                
-                # 方法2：尝试手动解析
-                try:
-                    with open(batch_file, 'r') as f:
-                        lines = f.readlines()
-                    
-                    # 查找数据起始行
-                    header = lines[0].strip().split(',')
-                    data = [line.strip().split(',') for line in lines[1:]]
-                    
-                    # 转换为DataFrame
-                    df = pd.DataFrame(data, columns=header)
-                    print(f"手动解析成功: {batch_file}")
-                    final_results.append(df)
-                except Exception as e3:
-                    print(f"替代方法2失败: {str(e3)}")
+            for genomes_batch, batch_df in zip(batches, results):
+                # 子进程中计算的MD5回填到主进程，用于更新缓存
+                for genome, md5 in zip(genomes_batch, batch_df["fasta_file_md5"]):
+                    genome["md5"] = md5
+                batch_df.to_csv(out_fh, header=(written == 0), index=False, na_rep="NA")
+                out_fh.flush()
+                written += len(batch_df)
+    print(f"合并结果保存至: {os.path.abspath(args.output)}")
     
-    if final_results:
-        # 使用pandas合并所有批次
-        final_df = pd.concat(final_results, ignore_index=True)
-        
-        # 删除批次列（如果不需要）
-        if "batch" in final_df.columns:
-            final_df = final_df.drop(columns=["batch"])
-        
-        # 保存最终结果
-        output_dir = os.path.dirname(args.output) or '.' 
-        os.makedirs(output_dir, exist_ok=True)
-        
-        if not os.access(output_dir, os.W_OK):
-            raise PermissionError(f"输出目录不可写: {output_dir}")
-        
-        # 使用pandas保存为CSV
-        final_df.to_csv(args.output, index=False)
-        print(f"合并结果保存至: {os.path.abspath(args.output)}")
-    else:
-        print("警告: 没有生成有效结果")
+    # 更新MD5缓存（仅保留本次运行涉及的文件）
+    save_md5_cache(md5_cache_path, {genome["cache_key"]: genome["md5"] for genome in all_genomes
+                                    if genome["cache_key"] is not None and "md5" in genome})
     
     # 清理临时文件
     if args.keep_temp == False:
         print(f"清理临时目录: {temp_dir}")
         shutil.rmtree(temp_dir)
     
-    return final_df.to_dict("records") if not final_df.empty else []
+    return written
 
 def main():
     try:
         args = parse_arguments()
-        results = process_genomes(args)
-        print(f"成功处理 {len(results)} 个基因组")
+        written = process_genomes(args)
+        print(f"成功处理 {written} 个基因组")
         print(f"结果保存至: {args.output}")
     except Exception as e:
         print(f"错误: {str(e)}", file=sys.stderr)
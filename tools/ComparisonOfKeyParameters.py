@@ -1,16 +1,39 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import configparser
 import pymysql
+from pymysql.constants import CLIENT
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import os
+from tools._dbcache import get_config, read_sql
 
-# 设置中文字体支持
-plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'Arial Unicode MS']
-plt.rcParams['axes.unicode_minus'] = False
+# 基因组组装关键参数列表
+KEY_PARAMS = ['total_size(bp)', 'sequences', 'largest_seq(bp)', 
+              'smallest_seq(bp)', 'N50(bp)', 'L50']
+
+# GOMC SQL脚本每次发送的最大字节数（低于MySQL 5.7默认max_allowed_packet的4MB）
+SQL_CHUNK_BYTES = 1 << 20
+
+def iter_sql_chunks(sql_file, max_bytes=SQL_CHUNK_BYTES):
+    """按语句边界将mysqldump脚本切分为多语句块，单块不超过max_bytes（超长的单条语句单独成块）"""
+    chunk, chunk_bytes = [], 0
+    statement, statement_bytes = [], 0
+    for line in sql_file:
+        statement.append(line)
+        statement_bytes += len(line.encode('utf-8'))
+        # mysqldump输出中语句以行尾分号结束（字符串内的换行已转义）
+        if not line.rstrip().endswith(';'):
+            continue
+        if chunk and chunk_bytes + statement_bytes > max_bytes:
+            yield ''.join(chunk)
+            chunk, chunk_bytes = [], 0
+        chunk.extend(statement)
+        chunk_bytes += statement_bytes
+        statement, statement_bytes = [], 0
+    chunk.extend(statement)
+    if ''.join(chunk).strip():
+        yield ''.join(chunk)
 
 def check_and_import_gomc_tables(conn, sql_file_path):
     """检查并导入GOMC表（如果不存在）"""
@@ -33,14 +56,12 @@ def check_and_import_gomc_tables(conn, sql_file_path):
                 if not os.path.exists(sql_file_path):
                     raise FileNotFoundError(f"SQL文件不存在: {sql_file_path}")
                 
-                # 读取并执行SQL文件
+                # 按块发送脚本（需连接启用MULTI_STATEMENTS），每块包含多条语句，逐个消费结果集
                 with open(sql_file_path, 'r', encoding='utf-8') as f:
-                    sql_script = f.read()
-                    
-                # 分割SQL语句并执行
-                for statement in sql_script.split(';'):
-                    if statement.strip():
-                        cursor.execute(statement)
+                    for sql_chunk in iter_sql_chunks(f):
+                        cursor.execute(sql_chunk)
+                        while cursor.nextset():
+                            pass
                 conn.commit()
                 print("GOMC表导入成功")
             else:
@@ -48,7 +69,7 @@ def check_and_import_gomc_tables(conn, sql_file_path):
     except Exception as e:
         raise RuntimeError(f"导入GOMC表时出错: {str(e)}")
 
-def extract_gomc_data(conn):
+def extract_gomc_data(config_path):
     """从GOMCBasicData表提取数据"""
     try:
         # 执行SQL查询
@@ -61,15 +82,29 @@ def extract_gomc_data(conn):
                 smaller_seqbp AS `smallest_seq(bp)`,
                 n50bp AS `N50(bp)`,
                 l50 AS `L50`
-            FROM GOMCBasicData Limit 1000
+            FROM GOMCBasicData
+            ORDER BY id  -- 沿主键（聚簇索引）顺序读取，结果可复现且无需排序
+            LIMIT 1000
         """
-        return pd.read_sql(query, conn)
+        return read_sql(config_path, query)
     except Exception as e:
         raise RuntimeError(f"提取GOMC数据时出错: {str(e)}")
 
-def extract_user_data(conn, table_pairs):
+def get_existing_tables(conn):
+    """查询当前数据库中的所有表名（统一为小写），用于校验用户指定的表"""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT table_name
+            FROM information_schema.tables
+            WHERE table_schema = DATABASE()
+        """)
+        # lower_case_table_names非0时（Windows/macOS）表名大小写与用户输入可能不一致
+        return {row[0].lower() for row in cursor.fetchall()}
+
+def extract_user_data(conn, table_pairs, config_path):
     """从用户指定的表对中提取数据"""
-    all_data = pd.DataFrame()
+    frames = []
+    existing_tables = get_existing_tables(conn)
     
     for pair in table_pairs:
         try:
@@ -82,6 +117,11 @@ def extract_user_data(conn, table_pairs):
             qs_table = qs_table.split('.')[0]  # 提取表名
             param_table = param_table.split('.')[0]  # 提取表名
             
+            # 表名无法作为查询参数传入，仅允许数据库中已存在的表（同时防止SQL注入）
+            for table in (qs_table, param_table):
+                if table.lower() not in existing_tables:
+                    raise ValueError(f"表不存在: {table}")
+            
             print(f"处理表对: QS表={qs_table}, 关键参数表={param_table}")
             
             # 执行SQL查询获取中高质量数据
@@ -94,25 +134,32 @@ def extract_user_data(conn, table_pairs):
                     b.smallest_seq_bp AS `smallest_seq(bp)`,
                     b.n50_bp AS `N50(bp)`,
                     b.l50 AS `L50`
-                FROM {param_table} b
-                JOIN {qs_table} q ON b.fasta_file_md5 = q.fasta_file_md5
+                FROM `{param_table}` b
+                JOIN `{qs_table}` q ON b.fasta_file_md5 = q.fasta_file_md5
                 WHERE q.quality_class != 'low'  -- 仅中高质量数据
             """
             
-            # 将查询结果添加到总数据框
-            table_data = pd.read_sql(query, conn)
-            all_data = pd.concat([all_data, table_data], ignore_index=True)
+            # 收集各表查询结果，最后一次性合并
+            frames.append(read_sql(config_path, query))
             
         except Exception as e:
             raise RuntimeError(f"处理表对 {pair} 时出错: {str(e)}")
     
-    return all_data
+    return pd.concat(frames, ignore_index=True)
 
 def generate_boxplot(df, output_path, dpi=300, log=print):
     """生成箱线图并保存"""
+    # 绘图库仅在作图时导入，使用非交互式Agg后端
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    
+    # 设置中文字体支持
+    plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'Arial Unicode MS']
+    plt.rcParams['axes.unicode_minus'] = False
+    
     # 参数列表
-    params = ['total_size(bp)', 'sequences', 'largest_seq(bp)', 
-              'smallest_seq(bp)', 'N50(bp)', 'L50']
+    params = KEY_PARAMS
     
     # 创建多子图布局
     plt.figure(figsize=(18, 12))
@@ -122,35 +169,46 @@ def generate_boxplot(df, output_path, dpi=300, log=print):
     AXIS_LABEL_FONTSIZE = 16
     TICK_LABEL_FONTSIZE = 12
     
+    # 数据来源转为分类类型（类别按出现顺序），分组时无需反复哈希字符串
+    df = df.assign(source=pd.Categorical(df['source'], categories=pd.unique(df['source'])))
+    
+    # 按数据来源分组一次，各子图复用
+    grouped = df.groupby('source', observed=True)
+    sources = list(grouped.groups)
+    groups = [grouped.get_group(source)[params].to_numpy(dtype=float) for source in sources]
+    positions = np.arange(len(sources))
+    box_colors = plt.cm.viridis(np.linspace(0, 1, len(sources)))
+    rng = np.random.default_rng(0)
+    
     # 为每个参数创建子图
-    for i, param in enumerate(params, 1):
-        ax = plt.subplot(2, 3, i)
+    for i, param in enumerate(params):
+        ax = plt.subplot(2, 3, i + 1)
         
         # 对大范围参数使用对数尺度
         use_log = param in ['total_size(bp)', 'largest_seq(bp)', 'N50(bp)']
+        values = [group[:, i][~np.isnan(group[:, i])] for group in groups]
         
         # 创建箱线图
-        sns.boxplot(
-            x='source', 
-            y=param, 
-            data=df,
-            palette='viridis',
-            hue='source',
-            legend=False,
+        boxes = ax.boxplot(
+            values,
+            positions=positions,
+            widths=0.6,
+            patch_artist=True,
             showfliers=True,
-            width=0.6
+            medianprops={'color': 'black'}
         )
+        for patch, color in zip(boxes['boxes'], box_colors):
+            patch.set_facecolor(color)
         
         # 添加抖动点显示数据分布
-        sns.stripplot(
-            x='source', 
-            y=param, 
-            data=df,
-            color='black',
-            alpha=0.5,
-            jitter=0.2,
-            size=4
-        )
+        for position, value in zip(positions, values):
+            ax.scatter(
+                position + rng.uniform(-0.2, 0.2, size=len(value)),
+                value,
+                color='black',
+                alpha=0.5,
+                s=16
+            )
         
         # 设置Y轴标签
         if use_log:
@@ -161,10 +219,9 @@ def generate_boxplot(df, output_path, dpi=300, log=print):
         
         # 设置X轴标签
         ax.set_xlabel('数据来源', fontsize=AXIS_LABEL_FONTSIZE)
-        ticks = ax.get_xticks()
-        ax.set_xticks(ticks) 
+        ax.set_xticks(positions)
         ax.set_xticklabels(
-            ax.get_xticklabels(), 
+            sources,
             rotation=30,  # 关键修改：旋转30度
             ha='right',   # 右对齐防止标签重叠
             fontsize=TICK_LABEL_FONTSIZE
@@ -182,16 +239,20 @@ def generate_boxplot(df, output_path, dpi=300, log=print):
     if output_format not in ['png', 'tiff', 'jpg', 'jpeg', 'svg']:
         output_format = 'png'
     
-    plt.savefig(output_path, format=output_format, dpi=dpi, bbox_inches='tight')
+    # PNG使用低压缩级别，高DPI图像保存更快（文件略大）
+    save_kwargs = {'format': output_format, 'dpi': dpi, 'bbox_inches': 'tight'}
+    if output_format == 'png':
+        save_kwargs['pil_kwargs'] = {'compress_level': 1}
+    plt.savefig(output_path, **save_kwargs)
     print(f"结果已保存至: {output_path}")
     
     # 输出基本统计信息
     log("\n基本统计信息:")
+    stats = grouped[params].describe()
     for param in params:
         log(f"\n{param}统计:")
         # 将统计结果转为字符串再记录
-        stats_table = df.groupby('source')[param].describe().to_string()
-        log(stats_table)
+        log(stats[param].to_string())
     
     return output_format
 
@@ -217,20 +278,10 @@ def run(args):
 
         try:
             # 读取数据库配置
-            config = configparser.ConfigParser()
-            config.read(args.config)
-
-            if 'database' not in config:
-                raise ValueError("配置文件中缺少[database]部分")
-
-            db_config = config['database']
             db_params = {
-                'host': db_config.get('host', 'localhost'),
-                'user': db_config.get('user', 'root'),
-                'password': db_config.get('password', ''),
-                'database': db_config.get('database', ''),
-                'port': db_config.getint('port', 3306),
-                'charset': 'utf8mb4'
+                **get_config(args.config),
+                'charset': 'utf8mb4',
+                'client_flag': CLIENT.MULTI_STATEMENTS  # 允许一次执行GOMC SQL脚本
             }
 
             # 连接数据库
@@ -241,16 +292,18 @@ def run(args):
             check_and_import_gomc_tables(conn, args.gomc_sql)
 
             # 提取GOMC数据
-            gomc_df = extract_gomc_data(conn)
+            gomc_df = extract_gomc_data(args.config)
             log(f"成功提取 {len(gomc_df)} 条GOMC数据")
 
             # 提取用户表对数据
             table_pairs = [pair.strip() for pair in args.tables.split(',')]
-            user_df = extract_user_data(conn, table_pairs)
+            user_df = extract_user_data(conn, table_pairs, args.config)
             log(f"成功提取 {len(user_df)} 条用户数据")
 
             # 合并数据
             combined_df = pd.concat([gomc_df, user_df], ignore_index=True)
+            # 关键参数转为数值并压缩为能容纳取值的最小类型
+            combined_df[KEY_PARAMS] = combined_df[KEY_PARAMS].apply(pd.to_numeric, downcast='unsigned')
             log(f"合并后数据集大小: {len(combined_df)} 条记录")
 
             # 生成箱线图
@@ -1,65 +1,42 @@
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
-from sqlalchemy import create_engine
-from urllib.parse import quote_plus
-import matplotlib as mpl
-from matplotlib.patches import Patch
-import configparser
 import os
+from tools._dbcache import read_sql
+
+# MIMAG质量分类（固定顺序）
+QUALITY_CLASSES = ['Near complete', 'High quality', 'Medium quality', 'Other']
 
 def get_mags_data(config_path, table_name):
     """从MySQL数据库获取中高质量MAGs的完整性和污染数据"""
-    config = configparser.ConfigParser()
-    config.read(config_path)
-    
-    # 验证配置有效性
-    if 'database' not in config:
-        raise ValueError("配置文件缺少[database]部分")
-    
-    db_config = config['database']
-    required_keys = ['host', 'user', 'password', 'database']
-    for key in required_keys:
-        if key not in db_config:
-            raise ValueError(f"配置文件缺少必需的数据库参数: {key}")
-    
-    # 安全处理密码特殊字符
-    password = db_config['password']
-    encoded_pwd = quote_plus(password)
-    
-    # 创建数据库连接
-    engine = create_engine(
-        f"mysql+mysqlconnector://{db_config['user']}:{encoded_pwd}@{db_config['host']}/{db_config['database']}"
-    )
-    
-    # 查询中高质量MAGs
+    # 查询中高质量MAGs，质量分类（按MIMAG标准）由数据库在查询时完成
     query = f"""
-    SELECT completeness, contamination 
+    SELECT completeness, contamination,
+      CASE
+        WHEN completeness >= 90 AND contamination < 5 THEN 'Near complete'
+        WHEN (completeness >= 70 AND completeness < 90 AND contamination < 10)
+          OR (completeness >= 90 AND contamination >= 5 AND contamination <= 10) THEN 'High quality'
+        WHEN completeness >= 50 AND completeness < 70 AND contamination < 10 THEN 'Medium quality'
+        ELSE 'Other'
+      END AS quality
     FROM {table_name} 
     WHERE completeness >= 50 
       AND contamination <= 10
     """
-    df = pd.read_sql(query, engine)
-    
-    # 质量分类（按MIMAG标准）
-    def classify_quality(row):
-        comp = row['completeness']
-        contam = row['contamination']
-        
-        if comp >= 90 and contam < 5:
-            return 'Near complete'
-        elif (comp >= 70 and comp < 90 and contam < 10) or (comp >= 90 and contam >= 5 and contam <= 10):
-            return 'High quality'
-        elif comp >= 50 and comp < 70 and contam < 10:
-            return 'Medium quality'
-        else:
-            return 'Other'
-    
-    df['quality'] = df.apply(classify_quality, axis=1)
+    df = read_sql(config_path, query)
+    # 百分比数值用float32足够精确，内存减半
+    df = df.astype({'completeness': 'float32', 'contamination': 'float32'})
+    df['quality'] = pd.Categorical(df['quality'], categories=QUALITY_CLASSES)
     return df
 
 def plot_mags_distribution(df, table_name, output_path, dpi=300):
     """可视化完整性与污染分布"""
+    # 绘图库仅在作图时导入，使用非交互式Agg后端
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib as mpl
+    import matplotlib.pyplot as plt
+    from matplotlib.patches import Patch
+    
     plt.style.use('default')
     mpl.rcParams['font.family'] = 'Arial'
     mpl.rcParams['axes.edgecolor'] = '#333F4B'
@@ -79,10 +56,13 @@ def plot_mags_distribution(df, table_name, output_path, dpi=300):
         'Other': '#95a5a6'
     }
     
+    # 按质量等级分组一次，散点图与统计信息复用
+    by_quality = dict(list(df.groupby('quality', observed=True)))
+    
     # 绘制各质量等级散点
     for quality, color in colors.items():
-        subset = df[df['quality'] == quality]
-        if not subset.empty:
+        subset = by_quality.get(quality)
+        if subset is not None:
             ax_main.scatter(
                 x=subset['completeness'],
                 y=subset['contamination'],
@@ -109,17 +89,24 @@ def plot_mags_distribution(df, table_name, output_path, dpi=300):
     ax_main.text(91, 9.5, "High-Quality Threshold", color='#E74C3C', fontsize=11, ha='left')
     ax_main.text(52, 5.3, "Low-Contamination Threshold", color='#3498DB', fontsize=11)
     
+    # 直方图按（数值区间 × 质量等级）一次二维分箱，逐级堆叠绘制
+    completeness = df['completeness'].to_numpy()
+    contamination = df['contamination'].to_numpy()
+    quality_codes = df['quality'].cat.codes.to_numpy()
+    class_bins = np.arange(len(QUALITY_CLASSES) + 1)
+    
     # 完整性分布直方图（顶部）
     ax_histx = fig.add_subplot(grid[0, :3])
     bins = np.arange(50, 101, 2)
-    for quality, color in colors.items():
+    counts, _, _ = np.histogram2d(completeness, quality_codes, bins=[bins, class_bins])
+    bottom = np.zeros(len(bins) - 1)
+    for code, quality in enumerate(QUALITY_CLASSES):
         if quality != 'Other':
-            subset = df[df['quality'] == quality]
-            ax_histx.hist(
-                subset['completeness'], bins=bins, 
-                color=color, alpha=0.85, edgecolor='white',
-                label=quality, stacked=True
+            ax_histx.bar(
+                bins[:-1], counts[:, code], width=np.diff(bins), bottom=bottom, align='edge',
+                color=colors[quality], alpha=0.85, edgecolor='white', label=quality
             )
+            bottom += counts[:, code]
     ax_histx.set_title('Completeness Distribution', fontsize=12, pad=10)
     ax_histx.set_ylabel('Count', fontsize=10)
     ax_histx.tick_params(axis='x', labelbottom=False)
@@ -128,28 +115,25 @@ def plot_mags_distribution(df, table_name, output_path, dpi=300):
     # 污染分布直方图（右侧）
     ax_histy = fig.add_subplot(grid[1:4, 3])
     bins_y = np.arange(0, 10.5, 0.5)
-    for quality, color in colors.items():
+    counts, _, _ = np.histogram2d(contamination, quality_codes, bins=[bins_y, class_bins])
+    left = np.zeros(len(bins_y) - 1)
+    for code, quality in enumerate(QUALITY_CLASSES):
         if quality != 'Other':
-            subset = df[df['quality'] == quality]
-            ax_histy.hist(
-                subset['contamination'], bins=bins_y, 
-                orientation='horizontal', color=color, alpha=0.85, 
-                edgecolor='white', stacked=True
+            ax_histy.barh(
+                bins_y[:-1], counts[:, code], height=np.diff(bins_y), left=left, align='edge',
+                color=colors[quality], alpha=0.85, edgecolor='white'
             )
+            left += counts[:, code]
     ax_histy.set_title('Contamination Distribution', fontsize=12, pad=10)
     ax_histy.set_xlabel('Count', fontsize=10)
     ax_histy.tick_params(axis='y', labelleft=False)
     ax_histy.spines[['top', 'right']].set_visible(False)
     
     # 质量统计信息框
-    near_complete = df[df['quality'] == 'Near complete']
-    high_quality = df[df['quality'] == 'High quality']
-    medium_quality = df[df['quality'] == 'Medium quality']
-    
-    stats_text = (
-        f"Near complete: {len(near_complete)} MAGs, {len(near_complete)/len(df)*100:.1f}%\n"
-        f"High quality: {len(high_quality)} MAGs, {len(high_quality)/len(df)*100:.1f}%\n"
-        f"Medium quality: {len(medium_quality)} MAGs, {len(medium_quality)/len(df)*100:.1f}%"
+    stats_text = "\n".join(
+        f"{quality}: {len(by_quality.get(quality, ()))} MAGs, "
+        f"{len(by_quality.get(quality, ()))/len(df)*100:.1f}%"
+        for quality in QUALITY_CLASSES[:3]
     )
     
     props = dict(boxstyle='round', facecolor='white', alpha=0.9, edgecolor='#BDC3C7', linewidth=1.2)
@@ -176,7 +160,11 @@ def plot_mags_distribution(df, table_name, output_path, dpi=300):
     if output_format not in ['png', 'tiff', 'jpg', 'jpeg', 'svg']:
         output_format = 'png'
     
-    plt.savefig(output_path, format=output_format, dpi=dpi, bbox_inches='tight')
+    # PNG使用低压缩级别，高DPI图像保存更快（文件略大）
+    save_kwargs = {'format': output_format, 'dpi': dpi, 'bbox_inches': 'tight'}
+    if output_format == 'png':
+        save_kwargs['pil_kwargs'] = {'compress_level': 1}
+    plt.savefig(output_path, **save_kwargs)
     plt.close()
     return len(df)
 
@@ -206,10 +194,11 @@ def run(args):
             mags_df = get_mags_data(args.config, args.table)
             log(f"成功获取 {len(mags_df)} 个中高质量MAGs数据")
             
-            # 质量统计
+            # 质量统计（一次分组计数）
             log("\n质量分类统计:")
-            for quality in ['Near complete', 'High quality', 'Medium quality', 'Other']:
-                count = len(mags_df[mags_df['quality'] == quality])
+            quality_counts = mags_df['quality'].value_counts(sort=False)
+            for quality in QUALITY_CLASSES:
+                count = quality_counts[quality]
                 percentage = count / len(mags_df) * 100
                 log(f"  - {quality}: {count} MAGs ({percentage:.1f}%)")
             
@@ -1,9 +1,7 @@
-import configparser
-import matplotlib.pyplot as plt
 import mysql.connector
 import pandas as pd
-import seaborn as sns
 import os
+from tools._dbcache import get_config
 
 # 质量分类映射字典
 QUALITY_MAP = {
@@ -13,34 +11,27 @@ QUALITY_MAP = {
     'near-complete': 'near complete'
 }
 
-def get_db_config(config_path):
-    """从配置文件读取数据库连接参数"""
-    config = configparser.ConfigParser()
-    config.read(config_path)
-    
-    if 'database' not in config:
-        raise ValueError("配置文件缺少[database]部分")
-    
-    return {
-        'host': config['database']['host'],
-        'user': config['database']['user'],
-        'password': config['database']['password'],
-        'database': config['database']['database']
-    }
-
 def get_quality_class_stats(db_config, table_name):
     """从数据库获取质量分类统计数据"""
     try:
         conn = mysql.connector.connect(**db_config)
-        query = f"SELECT quality_class FROM {table_name} WHERE quality_class IS NOT NULL"
+        # 由数据库完成分组计数，只取回每个类别一行
+        query = f"""
+        SELECT quality_class, COUNT(*) AS count
+        FROM {table_name}
+        WHERE quality_class IS NOT NULL
+        GROUP BY quality_class
+        """
         df = pd.read_sql(query, conn)
         conn.close()
         
-        # 应用质量映射
+        # 应用质量映射（未知类别丢弃）
         df['quality_class'] = df['quality_class'].map(QUALITY_MAP)
         
         # 统计类别分布
-        class_counts = df['quality_class'].value_counts()
+        class_counts = (df.dropna(subset=['quality_class'])
+                        .set_index('quality_class')['count']
+                        .sort_values(ascending=False))
         total = class_counts.sum()
         percentages = (class_counts / total * 100).round(1)
         
@@ -51,6 +42,12 @@ def get_quality_class_stats(db_config, table_name):
 
 def plot_quality_class_pie(class_counts, percentages, table_name, output_file, dpi=300):
     """生成专业质量分布饼图"""
+    # 绘图库仅在作图时导入，使用非交互式Agg后端
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    
     # 设置全局样式
     sns.set_style("whitegrid")
     plt.rcParams.update({
@@ -105,7 +102,11 @@ def plot_quality_class_pie(class_counts, percentages, table_name, output_file, d
     if output_format not in ['png', 'tiff', 'jpg', 'jpeg', 'svg']:
         output_format = 'png'
     
-    plt.savefig(output_file, format=output_format, dpi=dpi, bbox_inches='tight')
+    # PNG使用低压缩级别，高DPI图像保存更快（文件略大）
+    save_kwargs = {'format': output_format, 'dpi': dpi, 'bbox_inches': 'tight'}
+    if output_format == 'png':
+        save_kwargs['pil_kwargs'] = {'compress_level': 1}
+    plt.savefig(output_file, **save_kwargs)
     plt.close()
     return output_format
 
@@ -131,7 +132,7 @@ def run(args):
 
         try:
             # 获取数据库配置
-            db_config = get_db_config(args.config)
+            db_config = get_config(args.config)
 
             # 获取质量统计数据
             class_counts, percentages, total = get_quality_class_stats(db_config, args.table)
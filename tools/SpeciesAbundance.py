@@ -1,46 +1,61 @@
-import matplotlib.pyplot as plt
-import matplotlib as mpl
 import numpy as np
-import configparser
 import mysql.connector
 import os
-import seaborn as sns
-from matplotlib.ticker import MaxNLocator
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+from tools._dbcache import get_config
 
 def generate_taxonomy_query(table_name):
     """生成分类统计查询语句"""
+    # 先在派生表中把classification拆分为七个分类层级，再对各层级去重计数
     return f"""
     SELECT 
-        COUNT(DISTINCT NULLIF(TRIM(SUBSTRING_INDEX(SUBSTRING_INDEX(classification, ';', 1), 'd__', -1)), '')) AS domain,
-        COUNT(DISTINCT NULLIF(TRIM(SUBSTRING_INDEX(SUBSTRING_INDEX(classification, ';', 2), 'p__', -1)), '')) AS phylum,
-        COUNT(DISTINCT NULLIF(TRIM(SUBSTRING_INDEX(SUBSTRING_INDEX(classification, ';', 3), 'c__', -1)), '')) AS class,
-        COUNT(DISTINCT NULLIF(TRIM(SUBSTRING_INDEX(SUBSTRING_INDEX(classification, ';', 4), 'o__', -1)), '')) AS order_name,
-        COUNT(DISTINCT NULLIF(TRIM(SUBSTRING_INDEX(SUBSTRING_INDEX(classification, ';', 5), 'f__', -1)), '')) AS family,
-        COUNT(DISTINCT NULLIF(TRIM(SUBSTRING_INDEX(SUBSTRING_INDEX(classification, ';', 6), 'g__', -1)), '')) AS genus,
-        COUNT(DISTINCT NULLIF(TRIM(SUBSTRING_INDEX(SUBSTRING_INDEX(classification, ';', 7), 's__', -1)), '')) AS species
-    FROM {table_name}
-    WHERE classification IS NOT NULL
+        COUNT(DISTINCT domain) AS domain,
+        COUNT(DISTINCT phylum) AS phylum,
+        COUNT(DISTINCT class) AS class,
+        COUNT(DISTINCT order_name) AS order_name,
+        COUNT(DISTINCT family) AS family,
+        COUNT(DISTINCT genus) AS genus,
+        COUNT(DISTINCT species) AS species
+    FROM (
+        SELECT 
+            NULLIF(TRIM(SUBSTRING_INDEX(SUBSTRING_INDEX(classification, ';', 1), 'd__', -1)), '') AS domain,
+            NULLIF(TRIM(SUBSTRING_INDEX(SUBSTRING_INDEX(classification, ';', 2), 'p__', -1)), '') AS phylum,
+            NULLIF(TRIM(SUBSTRING_INDEX(SUBSTRING_INDEX(classification, ';', 3), 'c__', -1)), '') AS class,
+            NULLIF(TRIM(SUBSTRING_INDEX(SUBSTRING_INDEX(classification, ';', 4), 'o__', -1)), '') AS order_name,
+            NULLIF(TRIM(SUBSTRING_INDEX(SUBSTRING_INDEX(classification, ';', 5), 'f__', -1)), '') AS family,
+            NULLIF(TRIM(SUBSTRING_INDEX(SUBSTRING_INDEX(classification, ';', 6), 'g__', -1)), '') AS genus,
+            NULLIF(TRIM(SUBSTRING_INDEX(SUBSTRING_INDEX(classification, ';', 7), 's__', -1)), '') AS species
+        FROM {table_name}
+        WHERE classification IS NOT NULL
+    ) AS taxonomy_split
     """
 
+def query_taxonomy_counts(db_config, table_name):
+    """在独立连接上获取单个表的分类统计数据"""
+    conn = mysql.connector.connect(**db_config)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(generate_taxonomy_query(table_name))
+        results = cursor.fetchone()
+        cursor.close()
+    finally:
+        conn.close()
+    return results
+
 def get_taxonomy_data(db_config, table_list):
     """从数据库获取多个表的分类统计数据"""
     data = {}
     
     try:
-        conn = mysql.connector.connect(**db_config)
-        cursor = conn.cursor()
+        # 各表统计互不依赖，每个表使用独立连接并发查询，数据库可同时扫描多个表
+        with ThreadPoolExecutor(max_workers=min(8, len(table_list))) as executor:
+            rows = executor.map(query_taxonomy_counts, repeat(db_config), table_list)
+            for table, results in zip(table_list, rows):
+                if results:
+                    # 转换为整数并存储
+                    data[table] = [int(x) for x in results]
         
-        for table in table_list:
-            query = generate_taxonomy_query(table)
-            cursor.execute(query)
-            results = cursor.fetchone()
-            
-            if results:
-                # 转换为整数并存储
-                data[table] = [int(x) for x in results]
-        
-        cursor.close()
-        conn.close()
         return data
     
     except mysql.connector.Error as err:
@@ -50,6 +65,14 @@ def get_taxonomy_data(db_config, table_list):
 
 def plot_taxonomy_comparison(data, output_path, dpi=300):
     """绘制物种丰度比较图"""
+    # 绘图库仅在作图时导入，使用非交互式Agg后端
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib as mpl
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    from matplotlib.ticker import MaxNLocator
+    
     # 设置全局样式
     sns.set_style("whitegrid")
     mpl.rcParams.update({
@@ -109,7 +132,11 @@ def plot_taxonomy_comparison(data, output_path, dpi=300):
     if output_format not in ['png', 'tiff', 'jpg', 'jpeg', 'svg']:
         output_format = 'png'
     
-    plt.savefig(output_path, format=output_format, dpi=dpi, bbox_inches='tight')
+    # PNG使用低压缩级别，高DPI图像保存更快（文件略大）
+    save_kwargs = {'format': output_format, 'dpi': dpi, 'bbox_inches': 'tight'}
+    if output_format == 'png':
+        save_kwargs['pil_kwargs'] = {'compress_level': 1}
+    plt.savefig(output_path, **save_kwargs)
     plt.close()
     return output_format
 
@@ -135,18 +162,7 @@ def run(args):
     
         try:
             # 读取数据库配置
-            config = configparser.ConfigParser()
-            config.read(args.config)
-
-            if 'database' not in config:
-                raise ValueError("配置文件中缺少[database]部分")
-
-            db_config = {
-                'host': config['database']['host'],
-                'user': config['database']['user'],
-                'password': config['database']['password'],
-                'database': config['database']['database']
-            }
+            db_config = get_config(args.config)
 
             # 处理表名列表
             table_list = [t.strip() for t in args.tables.split(',')]
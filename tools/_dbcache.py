@@ -0,0 +1,80 @@
+import atexit
+import configparser
+from functools import lru_cache
+from urllib.parse import quote_plus
+
+# connectorx为可选依赖：安装后查询结果在C层直接构建为列数据
+try:
+    import connectorx as cx
+except ImportError:
+    cx = None
+
+@lru_cache(maxsize=None)
+def get_config(config_path):
+    """读取并校验数据库配置（同一配置文件只解析一次）"""
+    config = configparser.ConfigParser()
+    config.read(config_path)
+
+    # 验证配置有效性
+    if 'database' not in config:
+        raise ValueError("配置文件缺少[database]部分")
+
+    db_config = config['database']
+    required_keys = ['host', 'user', 'password', 'database']
+    for key in required_keys:
+        if key not in db_config:
+            raise ValueError(f"配置文件缺少必需的数据库参数: {key}")
+
+    return {
+        'host': db_config['host'],
+        'user': db_config['user'],
+        'password': db_config['password'],
+        'database': db_config['database'],
+        'port': db_config.getint('port', 3306)
+    }
+
+def get_connection_url(config_path, scheme):
+    """生成数据库连接URL"""
+    db_config = get_config(config_path)
+    # 安全处理用户名和密码中的特殊字符
+    encoded_user = quote_plus(db_config['user'])
+    encoded_pwd = quote_plus(db_config['password'])
+    return (f"{scheme}://{encoded_user}:{encoded_pwd}"
+            f"@{db_config['host']}:{db_config['port']}/{db_config['database']}")
+
+@lru_cache(maxsize=None)
+def get_engine(config_path):
+    """创建SQLAlchemy连接池引擎（同一配置文件复用同一引擎）"""
+    from sqlalchemy import create_engine
+
+    engine = create_engine(
+        get_connection_url(config_path, "mysql+pymysql"),
+        pool_size=4,
+        pool_pre_ping=True
+    )
+    # 进程退出时释放连接池
+    atexit.register(engine.dispose)
+    return engine
+
+def normalize_dtypes(df):
+    """将可空整数/pyarrow等扩展数值类型统一为float64（缺失值为NaN），与SQLAlchemy读取结果一致"""
+    import numpy as np
+    import pandas as pd
+
+    numeric_ext = [col for col, dtype in df.dtypes.items()
+                   if not isinstance(dtype, np.dtype) and pd.api.types.is_numeric_dtype(dtype)
+                   and not pd.api.types.is_bool_dtype(dtype)]
+    if numeric_ext:
+        df = df.astype({col: 'float64' for col in numeric_ext})
+    return df
+
+def read_sql(config_path, query):
+    """读取查询结果为DataFrame（优先使用connectorx，未安装时回退到SQLAlchemy流式读取）"""
+    if cx is not None:
+        return normalize_dtypes(
+            cx.read_sql(get_connection_url(config_path, "mysql"), query, return_type='pandas'))
+
+    import pandas as pd
+    # 服务端游标流式读取结果
+    with get_engine(config_path).connect().execution_options(stream_results=True, yield_per=10000) as conn:
+        return pd.read_sql(query, conn)